@@ -1,21 +1,86 @@
-from funasr import AutoModel
 import argparse
+import contextlib
+import functools
 import json
 import os
 from pathlib import Path
 import sys
 import threading
+import time
 import traceback
-from typing import Optional
+from typing import List, Optional, Union
+
+
+def _load_srt_fast() -> None:
+    """
+    srt_fast có thể đã được biên dịch bằng mypyc (file `.so`/`.pyd` nằm cạnh, import thay cho `.py`).
+    Nếu bản biên dịch cũ hơn srt_fast.py (sửa `.py` mà chưa build lại) thì cảnh báo ra stderr
+    và nạp bản `.py` vào sys.modules, để không âm thầm chạy code cũ.
+    """
+    import importlib.util
+
+    import srt_fast
+
+    compiled = srt_fast.__file__ or ""
+    source = os.path.join(os.path.dirname(compiled), "srt_fast.py")
+    if not compiled.endswith((".so", ".pyd")) or not os.path.exists(source):
+        return
+    if os.path.getmtime(compiled) >= os.path.getmtime(source):
+        return
+
+    print(
+        f"[funasr_runner] {os.path.basename(compiled)} is older than srt_fast.py; "
+        "using the pure-Python module (rebuild with `mypyc srt_fast.py`)",
+        file=sys.stderr,
+    )
+    spec = importlib.util.spec_from_file_location("srt_fast", source)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules["srt_fast"] = module
+
+
+_load_srt_fast()
+
+from srt_fast import (
+    _build_sentence_cues,
+    _render_srt_to,
+    generate_srt_advanced,
+    generate_srt_merged,
+    generate_srt_original,
+    generate_srt_output,
+    iter_srt_cues_advanced,
+    split_long_sentence_by_timestamp,
+    write_srt_output,
+)
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to stdlib json
+    orjson = None
+
+__all__ = [
+    "build_model",
+    "get_or_build_model",
+    "run_asr",
+    "split_long_sentence_by_timestamp",
+    "iter_srt_cues_advanced",
+    "generate_srt_advanced",
+    "generate_srt_original",
+    "generate_srt_merged",
+    "generate_srt_output",
+    "main",
+]
 
 
 # ==============================================================================
 # 1. CẤU HÌNH / MODEL / RUNNER (CLI-FRIENDLY)
 # ==============================================================================
+@functools.lru_cache(maxsize=None)
 def _find_repo_root(start: Path) -> Path:
     """
     Tìm repo root theo dấu hiệu có thư mục `models/`.
     Fallback: dùng parent của file hiện tại.
+    Cache theo `start` (mỗi parent là 1 lần stat).
     """
     for p in [start, *start.parents]:
         if (p / "models").exists():
@@ -23,10 +88,12 @@ def _find_repo_root(start: Path) -> Path:
     return start
 
 
+@functools.lru_cache(maxsize=None)
 def _default_model_paths():
     """
     Default theo file gốc (Windows path), nhưng nếu không tồn tại thì fallback
     qua đường dẫn tương đối trong repo.
+    Tính 1 lần / process; dict trả về dùng chung, không được sửa.
     """
     win = {
         "model": r"D:\0_code\3.Full-pipeline\fun-asr\models\iic\speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch",
@@ -65,6 +132,10 @@ def _resolve_ref_path(path_str: str, *, repo_root: Path, models_dir: Path) -> st
     return str(cand2)
 
 
+RUNTIMES = ("pytorch", "onnx", "onnx-int8")
+PRECISIONS = ("fp32", "fp16", "bf16")
+
+
 def build_model(
     *,
     model_path: str,
@@ -74,8 +145,26 @@ def build_model(
     ncpu: int,
     max_single_segment_time: int,
     max_end_silence_time: int,
+    runtime: str = "pytorch",
 ):
-    return AutoModel(
+    if runtime in ("onnx", "onnx-int8"):
+        return _OnnxPipeline(
+            model_path=model_path,
+            vad_model_path=vad_model_path,
+            punc_model_path=punc_model_path,
+            device=device,
+            ncpu=ncpu,
+            max_single_segment_time=max_single_segment_time,
+            max_end_silence_time=max_end_silence_time,
+            quantize=(runtime == "onnx-int8"),
+        )
+    if runtime != "pytorch":
+        raise ValueError(f"Unknown runtime: {runtime!r} (expected one of {', '.join(RUNTIMES)})")
+
+    # Lazy: funasr kéo theo torch/torchaudio/modelscope (vài giây), chỉ import khi thật sự build model.
+    from funasr import AutoModel
+
+    model = AutoModel(
         model=model_path,
         vad_model=vad_model_path,
         punc_model=punc_model_path,
@@ -88,238 +177,444 @@ def build_model(
             "max_end_silence_time": max_end_silence_time,
         },
     )
+    if device.startswith("cuda"):
+        _enable_tf32()
+    return model
 
 
-def run_asr(
-    *,
-    audio_path: str,
-    device: str,
-    ncpu: int,
-    batch_size_s: int,
-    hotword: str,
-    hotword_weight: float,
-    disable_punc: bool,
-    disable_itn: bool,
-    model_path: str,
-    vad_model_path: str,
-    punc_model_path: str,
-    max_single_segment_time: int,
-    max_end_silence_time: int,
-):
-    model = build_model(
-        model_path=model_path,
-        vad_model_path=vad_model_path,
-        punc_model_path=punc_model_path,
-        device=device,
-        ncpu=ncpu,
-        max_single_segment_time=max_single_segment_time,
-        max_end_silence_time=max_end_silence_time,
-    )
-
-    return model.generate(
-        input=audio_path,
-        batch_size_s=batch_size_s,
-        sentence_timestamp=True,
-        return_raw_text=False,
-        hotword=hotword,
-        hotword_weight=hotword_weight,
-        disable_punc=disable_punc,
-        disable_itn=disable_itn,
-    )
+def _enable_tf32() -> None:
+    import torch
 
-
-# ==============================================================================
-# 2. XỬ LÝ OUTPUT VÀ TẠO SRT
-# ==============================================================================
-def _to_srt_time(ms: int) -> str:
-    """Chuyển ms sang định dạng SRT 00:00:00,000"""
-    if ms < 0:
-        ms = 0
-    s, ms = divmod(int(ms), 1000)
-    m, s = divmod(s, 60)
-    h, m = divmod(m, 60)
-    return f"{h:02}:{m:02}:{s:02},{ms:03}"
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
 
 
-def generate_srt_original(result):
-    return _render_srt(_build_sentence_cues(result))
+# Ordinal GPU (vật lý) đã được ghim qua CUDA_VISIBLE_DEVICES trong process này.
+# Lần gọi main() sau trong cùng process dùng lại remap này thay vì suy ra từ biến môi trường.
+_PINNED_CUDA_ORDINAL: Optional[int] = None
 
 
-def generate_srt_merged(result):
-    cues = _build_sentence_cues(result)
-    cues = _merge_cues_for_srt(cues, max_words=_get_merge_max_words())
-    return _render_srt(cues)
+def _pin_cuda_device(device: str, *, runtime: str) -> str:
+    """
+    Ghim 1 GPU cho cả process trước khi CUDA được khởi tạo, rồi set_device/init 1 lần
+    để FunASR không tự chọn lại device giữa chừng:
+    - "cuda:N": kiểm tra N < số GPU, rồi CUDA_VISIBLE_DEVICES=N (nếu chưa set) + device "cuda:0".
+      Nếu CUDA_VISIBLE_DEVICES đã set từ bên ngoài thì giữ nguyên ordinal.
+    - "cuda" (không có ordinal): giữ nguyên chuỗi "cuda".
+    - Không có GPU: trả về device nguyên vẹn (không đụng biến môi trường), để FunASR tự fallback về CPU.
+    Chỉ áp dụng cho runtime pytorch (funasr_onnx tự xử lý device_id).
+    """
+    global _PINNED_CUDA_ORDINAL
+    if runtime != "pytorch" or not device.startswith("cuda"):
+        return device
 
+    ordinal = int(device.split(":", 1)[1]) if ":" in device else None
+    index = 0 if ordinal is None else ordinal
 
-def _is_merge_enabled() -> bool:
-    raw = os.environ.get("SRT_MERGE_ENABLED", "").strip().lower()
-    if not raw:
-        return False
-    return raw in {"1", "true", "yes", "y", "on"}
+    import torch
 
+    if ordinal is not None and _PINNED_CUDA_ORDINAL is not None:
+        if ordinal != _PINNED_CUDA_ORDINAL:
+            raise ValueError(
+                f"CUDA device already pinned to cuda:{_PINNED_CUDA_ORDINAL} in this process; "
+                f"cannot switch to {device}"
+            )
+        index = 0
+    else:
+        # device_count() đếm qua NVML, chưa khởi tạo CUDA driver: vẫn còn kịp set
+        # CUDA_VISIBLE_DEVICES. (is_available() thì khởi tạo driver, không dùng ở đây.)
+        count = torch.cuda.device_count()
+        if count == 0:
+            return device
+        if ordinal is not None:
+            if ordinal >= count:
+                raise ValueError(f"Invalid CUDA device {device}: only {count} GPU(s) visible")
+            if "CUDA_VISIBLE_DEVICES" not in os.environ:
+                os.environ["CUDA_VISIBLE_DEVICES"] = str(ordinal)
+                _PINNED_CUDA_ORDINAL = ordinal
+                index = 0
+
+    torch.cuda.set_device(index)
+    torch.cuda.init()
+    return device if ordinal is None else f"cuda:{index}"
+
+
+def _inference_context(model, *, device: str, precision: str):
+    """
+    PyTorch: inference_mode, cộng thêm autocast fp16/bf16 khi chạy CUDA.
+    fp32 / CPU / ONNX: không đổi gì.
+    """
+    stack = contextlib.ExitStack()
+    if isinstance(model, _OnnxPipeline):
+        return stack
 
-def _is_strip_middle_punct_enabled() -> bool:
-    raw = os.environ.get("SRT_MERGE_STRIP_MIDDLE_PUNCT", "").strip().lower()
-    if not raw:
-        return True
-    return raw in {"1", "true", "yes", "y", "on"}
+    import torch
 
+    stack.enter_context(torch.inference_mode())
+    if device.startswith("cuda") and precision != "fp32":
+        dtype = torch.bfloat16 if precision == "bf16" else torch.float16
+        stack.enter_context(torch.autocast("cuda", dtype=dtype))
+    return stack
 
-def generate_srt_output(result):
-    return generate_srt_merged(result) if _is_merge_enabled() else generate_srt_original(result)
 
+class _OnnxPipeline:
+    """
+    VAD -> ASR -> Punc chạy bằng `funasr_onnx` (ONNX Runtime), `.generate()`
+    trả về cùng format với AutoModel: mỗi đoạn VAD là 1 item trong `sentence_info`.
+    - quantize=True: load `model_quant.onnx` (int8) thay vì `model.onnx`.
+    - Timestamp chỉ ở mức câu (start/end của đoạn VAD), không có timestamp từng chữ.
+    - max_single_segment_time/max_end_silence_time: mặc định lúc build, có thể override
+      theo từng lần `.generate()` giống vad_kwargs của AutoModel.
+    """
 
-def _get_merge_max_words() -> int:
-    raw = os.environ.get("SRT_MERGE_MAX_WORDS", "").strip()
-    try:
-        value = int(raw)
-        if value <= 0:
-            return 15
-        return value
-    except Exception:
-        return 15
+    def __init__(
+        self,
+        *,
+        model_path: str,
+        vad_model_path: str,
+        punc_model_path: str,
+        device: str,
+        ncpu: int,
+        max_single_segment_time: int,
+        max_end_silence_time: int,
+        quantize: bool,
+    ):
+        from funasr_onnx import CT_Transformer, Fsmn_vad, Paraformer, SeacoParaformer
+
+        # funasr_onnx compares device_id against the string "-1" to pick the CPU provider;
+        # its sessions already run with ORT_ENABLE_ALL graph optimizations.
+        device_id = device.split(":", 1)[1] if ":" in device else "0"
+        if not device.startswith("cuda"):
+            device_id = "-1"
+        common = {"device_id": device_id, "quantize": quantize, "intra_op_num_threads": ncpu}
+
+        self._seaco = any(Path(model_path).glob("model_eb*.onnx"))
+        asr_cls = SeacoParaformer if self._seaco else Paraformer
+        self._asr = asr_cls(model_path, batch_size=1, **common)
+        self._vad = Fsmn_vad(vad_model_path, batch_size=1, max_end_sil=max_end_silence_time, **common)
+        self._max_single_segment_time = max_single_segment_time
+        self._max_end_silence_time = max_end_silence_time
+        self._punc = CT_Transformer(punc_model_path, batch_size=1, **common)
+
+    def generate(
+        self,
+        input,
+        *,
+        hotword: str = "",
+        disable_punc: bool = False,
+        max_single_segment_time: Optional[int] = None,
+        max_end_silence_time: Optional[int] = None,
+        **kwargs,
+    ):
+        import librosa
+
+        # Fsmn_vad đọc max_end_sil từ chính nó, max_single_segment_time từ vad_opts
+        # của E2EVadModel (model_conf trong config.yaml): ghi đè trước mỗi lần gọi.
+        self._vad.max_end_sil = max_end_silence_time or self._max_end_silence_time
+        self._vad.vad_scorer.vad_opts.max_single_segment_time = (
+            max_single_segment_time or self._max_single_segment_time
+        )
 
+        audio_list = input if isinstance(input, (list, tuple)) else [input]
+        results = []
+        for audio_path in audio_list:
+            wav, _ = librosa.load(audio_path, sr=16000)
+            segments = self._vad(wav)[0]
+
+            sentence_info = []
+            for start_ms, end_ms in segments:
+                seg = wav[int(start_ms) * 16 : int(end_ms) * 16]
+                if self._seaco:
+                    asr_res = self._asr(seg, hotword)
+                else:
+                    asr_res = self._asr(seg)
+                text = _onnx_pred_text(asr_res[0]) if asr_res else ""
+                if not text:
+                    continue
+                if not disable_punc:
+                    text = self._punc(text)[0]
+                sentence_info.append(
+                    {"text": text, "start": int(start_ms), "end": int(end_ms), "timestamp": []}
+                )
 
-def _build_sentence_cues(result):
-    cues = []
-    items = result if isinstance(result, list) else [result]
-    for item in items:
-        if "sentence_info" not in item:
-            continue
-        for sentence in item["sentence_info"]:
-            cues.append(
+            results.append(
                 {
-                    "start": int(sentence.get("start", 0)),
-                    "end": int(sentence.get("end", 0)),
-                    "text": str(sentence.get("text", "")),
+                    "key": Path(audio_path).stem,
+                    "text": "".join(s["text"] for s in sentence_info),
+                    "sentence_info": sentence_info,
                 }
             )
-    return cues
+        return results
 
 
-def _render_srt(cues) -> str:
-    lines = []
-    index = 1
-    for cue in cues:
-        lines.append(str(index))
-        lines.append(f"{_to_srt_time(cue['start'])} --> {_to_srt_time(cue['end'])}")
-        lines.append(cue["text"])
-        lines.append("")
-        index += 1
-    return "\n".join(lines).rstrip() + "\n"
+def _onnx_pred_text(asr_item) -> str:
+    preds = asr_item.get("preds", "")
+    if isinstance(preds, (list, tuple)):
+        preds = preds[0] if preds else ""
+    return str(preds).strip()
 
 
-_NON_FINAL_JOIN_PUNCT = {",", "，", "、"}
-_FINAL_PUNCT = {".", "!", "?", "。", "！", "？"}
+_WAVEFORM_SR = 16000
 
 
-def _strip_trailing_join_punct(text: str) -> str:
-    if not text:
-        return text
-    if not _is_strip_middle_punct_enabled():
-        return text
-    last = text[-1]
-    if last in _NON_FINAL_JOIN_PUNCT:
-        return text[:-1]
-    return text
-
+def _load_waveform(audio_path: str):
+    """
+    Đọc PCM float32 của file mono 16 kHz (mỗi lần gọi 1 array mới, không cache:
+    worker sống lâu và server xoá file audio sau mỗi job).
+    Trả về None để FunASR tự đọc/resample như cũ.
+    """
+    try:
+        import soundfile as sf
 
-def _needs_space_between(a: str, b: str) -> bool:
-    if not a or not b:
-        return False
-    if a[-1].isspace() or b[0].isspace():
-        return False
-    # Only add a space for Latin/digit boundaries (avoid messing with CJK).
-    return a[-1].isascii() and b[0].isascii() and a[-1].isalnum() and b[0].isalnum()
+        info = sf.info(audio_path)
+        if info.samplerate != _WAVEFORM_SR or info.channels != 1:
+            return None
+        wav, _ = sf.read(audio_path, dtype="float32", always_2d=False)
+        return wav
+    except Exception:
+        return None
 
 
-def _count_words_mixed(text: str) -> int:
+def _preload_input(model, audio_path: str):
     """
-    - CJK (Han/Hiragana/Katakana/Hangul): đếm theo ký tự (bỏ whitespace/punct).
-    - Latin: đếm theo token whitespace (bỏ token chỉ có dấu).
+    AutoModel (có VAD) decode file 2 lần mỗi lần generate: 1 lần cho VAD, 1 lần cho ASR.
+    Truyền waveform đã đọc sẵn để chỉ decode 1 lần. ONNX pipeline đọc file 1 lần sẵn rồi.
     """
-    cjk = 0
-    latin_buf = []
+    if isinstance(model, _OnnxPipeline):
+        return audio_path
+    wav = _load_waveform(audio_path)
+    return audio_path if wav is None else wav
 
-    for ch in text:
-        if ch.isspace():
-            latin_buf.append(" ")
-            continue
 
-        code = ord(ch)
-        is_cjk = (
-            (0x4E00 <= code <= 0x9FFF)  # CJK Unified Ideographs
-            or (0x3400 <= code <= 0x4DBF)  # CJK Extension A
-            or (0x3040 <= code <= 0x309F)  # Hiragana
-            or (0x30A0 <= code <= 0x30FF)  # Katakana
-            or (0xAC00 <= code <= 0xD7AF)  # Hangul Syllables
+def _restore_keys(res, audio_paths: List[str]):
+    # Input là waveform thì FunASR đặt key ngẫu nhiên; giữ key = tên file như khi truyền path.
+    for item, audio_path in zip(res, audio_paths):
+        item["key"] = os.path.splitext(os.path.basename(audio_path))[0]
+    return res
+
+
+_MODEL_CACHE: dict = {}
+
+
+def get_or_build_model(
+    *,
+    model_path: str,
+    vad_model_path: str,
+    punc_model_path: str,
+    device: str,
+    ncpu: int,
+    max_single_segment_time: int,
+    max_end_silence_time: int,
+    runtime: str = "pytorch",
+):
+    """
+    Trả về AutoModel đã build cho cùng bộ tham số (cache trong process),
+    tránh load lại Paraformer/VAD/Punc mỗi lần chạy.
+    """
+    key = (
+        model_path,
+        vad_model_path,
+        punc_model_path,
+        device,
+        ncpu,
+        max_single_segment_time,
+        max_end_silence_time,
+        runtime,
+    )
+    model = _MODEL_CACHE.get(key)
+    if model is None:
+        model = build_model(
+            model_path=model_path,
+            vad_model_path=vad_model_path,
+            punc_model_path=punc_model_path,
+            device=device,
+            ncpu=ncpu,
+            max_single_segment_time=max_single_segment_time,
+            max_end_silence_time=max_end_silence_time,
+            runtime=runtime,
         )
-        if is_cjk:
-            cjk += 1
-            latin_buf.append(" ")
-            continue
+        _MODEL_CACHE[key] = model
+    return model
 
-        latin_buf.append(ch)
 
-    latin_tokens = 0
-    for tok in "".join(latin_buf).split():
-        # Count if token contains at least one letter/digit.
-        if any(ch.isalnum() for ch in tok):
-            latin_tokens += 1
+def run_asr(
+    *,
+    audio_path: Union[str, List[str]],
+    device: str,
+    ncpu: int,
+    batch_size_s: int,
+    hotword: str,
+    hotword_weight: float,
+    disable_punc: bool,
+    disable_itn: bool,
+    model_path: str,
+    vad_model_path: str,
+    punc_model_path: str,
+    max_single_segment_time: int,
+    max_end_silence_time: int,
+    runtime: str = "pytorch",
+    precision: str = "fp32",
+):
+    """
+    `audio_path` có thể là 1 path hoặc list path: truyền nguyên list vào
+    `model.generate`, kết quả trả về theo đúng thứ tự input (1 item / file).
+    Với VAD, FunASR vẫn chạy lần lượt từng file; `batch_size_s` gom batch các đoạn VAD trong 1 file.
+    Trong từng file, AutoModel đã sort các đoạn VAD theo độ dài trước khi gom batch
+    (giảm padding) rồi trả lại đúng thứ tự thời gian, nên không cần sort thêm ở đây.
+    """
+    model = get_or_build_model(
+        model_path=model_path,
+        vad_model_path=vad_model_path,
+        punc_model_path=punc_model_path,
+        device=device,
+        ncpu=ncpu,
+        max_single_segment_time=max_single_segment_time,
+        max_end_silence_time=max_end_silence_time,
+        runtime=runtime,
+    )
 
-    return cjk + latin_tokens
+    audio_paths = [audio_path] if isinstance(audio_path, str) else list(audio_path)
+    # Chỉ đọc sẵn waveform khi có đúng 1 file; list nhiều file vẫn truyền path để FunASR
+    # decode lần lượt từng file (không giữ PCM của cả list trong RAM).
+    if len(audio_paths) == 1:
+        audio_input = _preload_input(model, audio_paths[0])
+    else:
+        audio_input = audio_paths
+
+    with _inference_context(model, device=device, precision=precision):
+        res = model.generate(
+            input=audio_input,
+            fs=_WAVEFORM_SR,
+            batch_size_s=batch_size_s,
+            sentence_timestamp=True,
+            return_raw_text=False,
+            hotword=hotword,
+            hotword_weight=hotword_weight,
+            disable_punc=disable_punc,
+            disable_itn=disable_itn,
+        )
+    return _restore_keys(res, audio_paths)
 
 
-def _merge_cues_for_srt(cues, *, max_words: int):
+# ==============================================================================
+# 2. XỬ LÝ OUTPUT VÀ TẠO SRT (logic SRT nằm ở srt_fast.py)
+# ==============================================================================
+def _write_json(res, path: Union[str, Path], *, pretty: bool) -> None:
     """
-    Rule:
-    - Merge only when cue[i].text ends with comma-like (,_，、) AND NOT sentence-ending (.?! 。！？)
-    - Only merge when next.start == current.end (gap exactly 0ms).
-    - When merging, remove the join punctuation at the boundary (e.g. "A," + "B," => "AB,").
-    - Do not merge if merged text would exceed max_words (mixed counting).
+    Ghi JSON debug: dùng orjson nếu có (nhanh hơn nhiều với output có timestamp từng chữ),
+    chỉ indent khi pretty=True.
+    Không có orjson: json.dump ghi dần ra file (buffer lớn) thay vì dựng nguyên chuỗi
+    JSON trong RAM rồi encode lại sang UTF-8.
     """
-    if not cues:
-        return cues
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(res, option=option))
+        return
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        json.dump(res, f, ensure_ascii=False, indent=2 if pretty else None)
 
-    out = []
-    i = 0
-    while i < len(cues):
-        cur = dict(cues[i])
-        while i + 1 < len(cues):
-            nxt = cues[i + 1]
 
-            if int(cur["end"]) != int(nxt["start"]):
-                break
+def _write_outputs(
+    res: list,
+    base: str,
+    *,
+    out_dir: str,
+    max_chars_per_line: int,
+    write_json: bool,
+    pretty_json: bool,
+    write_orig_srt: bool,
+) -> str:
+    """
+    Ghi output của 1 file audio (JSON debug, SRT, SRT gốc); trả về path SRT.
+    - res: list kết quả FunASR của file (thường chỉ 1 item).
+    - base: tên file output, không gồm đuôi `.funasr.*`.
+    Được gọi trên thread ghi output trong lúc model chạy file kế tiếp.
+    """
+    out_dir = Path(out_dir)
+    srt_path = out_dir / f"{base}.funasr.srt"
 
-            cur_text = str(cur.get("text", ""))
-            if not cur_text:
-                break
+    def _write_srt() -> None:
+        with srt_path.open("w", encoding="utf-8", buffering=1 << 20) as f:
+            if max_chars_per_line > 0:
+                f.writelines(iter_srt_cues_advanced(res, max_chars_per_line))
+            else:
+                write_srt_output(res, f)
+
+    def _write_orig_srt() -> None:
+        orig_path = out_dir / f"{base}.funasr.orig.srt"
+        with orig_path.open("w", encoding="utf-8", buffering=1 << 20) as f:
+            _render_srt_to(_build_sentence_cues(res), f)
+
+    jobs = [_write_srt]
+    if write_json:
+        jobs.append(lambda: _write_json(res, out_dir / f"{base}.funasr.json", pretty=pretty_json))
+    if write_orig_srt:
+        jobs.append(_write_orig_srt)
+
+    if len(jobs) == 1:
+        _write_srt()
+    else:
+        # Các output độc lập nhau: chạy song song để ghi file (nhả GIL) chồng lên phần format.
+        from concurrent.futures import ThreadPoolExecutor
 
-            last = cur_text[-1]
-            if last in _FINAL_PUNCT:
-                break
-            if last not in _NON_FINAL_JOIN_PUNCT:
-                break
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            for fut in [pool.submit(job) for job in jobs]:
+                fut.result()
 
-            left = _strip_trailing_join_punct(cur_text)
-            right = str(nxt.get("text", ""))
-            join = " " if _needs_space_between(left, right) else ""
-            merged_text = f"{left}{join}{right}"
+    return str(srt_path)
 
-            if _count_words_mixed(merged_text) > max_words:
-                break
 
-            cur["text"] = merged_text
-            cur["end"] = int(nxt.get("end", cur["end"]))
-            i += 1
+_mkdir_cache: set = set()
 
-        out.append(cur)
-        i += 1
 
-    return out
+def _ensure_dir(path) -> None:
+    """
+    mkdir -p, nhớ các thư mục đã tạo trong process để bỏ qua syscall ở các lần sau.
+    Chỉ dùng cho CLI (process ngắn); worker gọi os.makedirs trực tiếp mỗi request.
+    """
+    key = str(path)
+    if key not in _mkdir_cache:
+        os.makedirs(key, exist_ok=True)
+        _mkdir_cache.add(key)
 
 
-def main():
+def _read_json(path: Path) -> list:
+    """
+    Đọc lại `.funasr.json` đã ghi bằng --write-json (list kết quả, hoặc 1 object).
+    """
+    if orjson is not None:
+        res = orjson.loads(path.read_bytes())
+    else:
+        res = json.loads(path.read_text(encoding="utf-8"))
+    return res if isinstance(res, list) else [res]
+
+
+def _json_output_base(path: Path) -> str:
+    name = path.name
+    return name[: -len(".funasr.json")] if name.endswith(".funasr.json") else path.stem
+
+
+def _read_manifest(path: str) -> List[str]:
+    """
+    Manifest: mỗi dòng 1 path audio, hoặc 1 object JSON có key "audio" (.jsonl).
+    """
+    audio_list = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            audio_list.append(str(json.loads(line)["audio"]) if line.startswith("{") else line)
+    return audio_list
+
+
+def main(argv=None, **defaults):
+    """
+    CLI entry point. `defaults` overrides argparse defaults (e.g. check.py's legacy settings).
+    """
     repo_root = _find_repo_root(Path(__file__).resolve().parent)
     models_dir = Path(os.environ.get("FUNASR_MODELS_DIR", str(repo_root / "models")))
     paths = _default_model_paths()
@@ -338,15 +633,52 @@ def main():
         help="Worker auto-exit after N seconds idle (only in --worker mode).",
     )
     parser.add_argument(
+        "--warmup-audio",
+        default=os.environ.get("FUNASR_WARMUP_AUDIO", ""),
+        help="Audio transcribed once before the worker reports ready (only in --worker mode).",
+    )
+    env_audio = os.environ.get("AUDIO_PATH", "")
+    audio_group = parser.add_mutually_exclusive_group()
+    audio_group.add_argument(
         "--audio",
-        default=os.environ.get("AUDIO_PATH", ""),
-        help="Path to audio file",
+        nargs="+",
+        default=[env_audio] if env_audio else [],
+        help="Path to audio file(s); the model is loaded once and reused",
+    )
+    audio_group.add_argument(
+        "--manifest",
+        default="",
+        help="Text/JSONL file listing audio paths (one per line, or {\"audio\": ...})",
+    )
+    audio_group.add_argument(
+        "--from-json",
+        nargs="+",
+        default=[],
+        help="Re-render SRT from cached .funasr.json file(s) (--write-json output); no model is loaded",
     )
     parser.add_argument("--out-dir", default="outpt_srt", help="Output directory")
+    parser.add_argument(
+        "--max-chars-per-line",
+        type=int,
+        default=0,
+        help="Split long sentences by word timestamps into lines of ~N chars (0 = off)",
+    )
 
     parser.add_argument("--device", default=os.environ.get("DEVICE", "cuda"))
     parser.add_argument("--ncpu", type=int, default=int(os.environ.get("NCPU", "8")))
     parser.add_argument("--batch-size-s", type=int, default=1800)
+    parser.add_argument(
+        "--runtime",
+        choices=RUNTIMES,
+        default=os.environ.get("FUNASR_RUNTIME", "pytorch"),
+        help="Inference backend: PyTorch (default) or ONNX Runtime via funasr_onnx (onnx-int8 = quantized)",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default=os.environ.get("FUNASR_PRECISION") or None,
+        help="Autocast dtype for the PyTorch CUDA path (default: fp16 on CUDA, fp32 otherwise)",
+    )
 
     parser.add_argument("--hotword", default="")
     parser.add_argument("--hotword-weight", type=float, default=1.0)
@@ -368,6 +700,12 @@ def main():
         default=False,
         help="Write .funasr.json output (debug)",
     )
+    parser.add_argument(
+        "--pretty-json",
+        action="store_true",
+        default=False,
+        help="Indent the .funasr.json output (slower on long audio)",
+    )
     parser.add_argument(
         "--write-orig-srt",
         action="store_true",
@@ -381,13 +719,17 @@ def main():
         help="Print processed SRT path to stdout",
     )
 
-    args = parser.parse_args()
+    parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+    if not args.precision:
+        args.precision = "fp16" if args.device.startswith("cuda") else "fp32"
 
     model_path = _resolve_ref_path(args.model, repo_root=repo_root, models_dir=models_dir)
     vad_model_path = _resolve_ref_path(args.vad_model, repo_root=repo_root, models_dir=models_dir)
     punc_model_path = _resolve_ref_path(args.punc_model, repo_root=repo_root, models_dir=models_dir)
 
     if args.worker:
+        args.device = _pin_cuda_device(args.device, runtime=args.runtime)
         _run_worker(
             args,
             model_path=model_path,
@@ -396,15 +738,36 @@ def main():
         )
         return
 
-    if not args.audio:
-        raise SystemExit("Missing --audio (or set AUDIO_PATH)")
+    write_kwargs = dict(
+        out_dir=args.out_dir,
+        max_chars_per_line=args.max_chars_per_line,
+        write_json=args.write_json,
+        pretty_json=args.pretty_json,
+        write_orig_srt=args.write_orig_srt,
+    )
+
+    if args.from_json:
+        # SRT-only re-run: funasr/torch are never imported on this path.
+        _ensure_dir(args.out_dir)
+        write_kwargs["write_json"] = False
+        srt_paths = [
+            _write_outputs(_read_json(Path(p)), _json_output_base(Path(p)), **write_kwargs)
+            for p in args.from_json
+        ]
+        _print_result(srt_paths, print_srt_path=args.print_srt_path)
+        return
+
+    audio_list = _read_manifest(args.manifest) if args.manifest else args.audio
+    if not audio_list:
+        raise SystemExit("Missing --audio/--manifest/--from-json (or set AUDIO_PATH)")
+
+    # Chỉ ghim GPU (import torch, khởi tạo CUDA) sau khi tham số đã hợp lệ.
+    args.device = _pin_cuda_device(args.device, runtime=args.runtime)
 
     out_dir = Path(args.out_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
-    base = Path(args.audio).stem
+    _ensure_dir(out_dir)
 
-    res = run_asr(
-        audio_path=args.audio,
+    run_kwargs = dict(
         device=args.device,
         ncpu=args.ncpu,
         batch_size_s=args.batch_size_s,
@@ -417,65 +780,112 @@ def main():
         punc_model_path=punc_model_path,
         max_single_segment_time=args.max_single_segment_time,
         max_end_silence_time=args.max_end_silence_time,
+        runtime=args.runtime,
+        precision=args.precision,
     )
 
-    if args.write_json:
-        (out_dir / f"{base}.funasr.json").write_text(
-            json.dumps(res, ensure_ascii=False, indent=2), encoding="utf-8"
-        )
+    # AutoModel (có VAD) vốn xử lý từng file một trong generate() (chỉ gom batch các đoạn VAD
+    # trong cùng 1 file), nên gọi run_asr theo từng file không mất batching: output của file
+    # trước được format + ghi trên 1 thread trong lúc model chạy file sau.
+    from concurrent.futures import ThreadPoolExecutor
 
-    srt_content = generate_srt_output(res)
-    srt_path = out_dir / f"{base}.funasr.srt"
-    srt_path.write_text(srt_content, encoding="utf-8")
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        futures = []
+        for audio_path in audio_list:
+            res = run_asr(audio_path=audio_path, **run_kwargs)
+            futures.append(writer.submit(_write_outputs, res, Path(audio_path).stem, **write_kwargs))
+        srt_paths = [f.result() for f in futures]
 
-    if args.write_orig_srt:
-        orig_srt_content = _render_srt(_build_sentence_cues(res))
-        (out_dir / f"{base}.funasr.orig.srt").write_text(orig_srt_content, encoding="utf-8")
+    _print_result(srt_paths, print_srt_path=args.print_srt_path)
 
-    if args.print_srt_path:
-        print(str(srt_path))
+
+def _print_result(srt_paths: List[str], *, print_srt_path: bool) -> None:
+    if print_srt_path:
+        for srt_path in srt_paths:
+            print(srt_path)
     else:
         print("Done!")
 
 
 class _IdleExit:
+    """
+    Tự thoát process khi idle quá `idle_seconds`.
+    1 thread daemon duy nhất kiểm tra deadline (time.monotonic); touch()/stop()
+    chỉ ghi lại deadline, không tạo Timer/thread mới cho mỗi request.
+    """
+
     def __init__(self, idle_seconds: int):
         self._idle_seconds = max(1, int(idle_seconds))
-        self._lock = threading.Lock()
-        self._timer: Optional[threading.Timer] = None
+        self._poll_seconds = min(1.0, float(self._idle_seconds))
+        self._deadline: Optional[float] = None  # None = đang bận, không tự thoát
+        self._thread: Optional[threading.Thread] = None
 
     def start(self) -> None:
         self.touch()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="idle-exit", daemon=True)
+            self._thread.start()
 
     def touch(self) -> None:
-        with self._lock:
-            if self._timer:
-                self._timer.cancel()
-            self._timer = threading.Timer(self._idle_seconds, self._exit_now)
-            self._timer.daemon = True
-            self._timer.start()
+        self._deadline = time.monotonic() + self._idle_seconds
 
     def stop(self) -> None:
-        with self._lock:
-            if self._timer:
-                self._timer.cancel()
-                self._timer = None
+        self._deadline = None
 
-    @staticmethod
-    def _exit_now() -> None:
-        os._exit(0)
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self._poll_seconds)
+            deadline = self._deadline
+            if deadline is not None and time.monotonic() >= deadline:
+                os._exit(0)
 
 
 def _jsonl_write(obj) -> None:
-    sys.stdout.write(json.dumps(obj, ensure_ascii=False) + "\n")
-    sys.stdout.flush()
+    """
+    Ghi 1 dòng JSONL (UTF-8) thẳng ra sys.stdout.buffer: orjson nếu có, 1 write + 1 flush / message.
+    """
+    out = sys.stdout
+    buf = getattr(out, "buffer", None)
+    if buf is None:
+        out.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        out.flush()
+        return
+    if orjson is not None:
+        data = orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    else:
+        data = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+    # Text còn trong buffer của sys.stdout (vd. print của FunASR) phải ra trước.
+    out.flush()
+    buf.write(data)
+    buf.flush()
 
 
-def _run_worker(args, *, model_path: str, vad_model_path: str, punc_model_path: str) -> None:
-    idle = _IdleExit(args.idle_seconds)
-    idle.start()
+def _warmup_model(model, args) -> None:
+    """
+    Chạy thử 1 file trước khi báo ready để CUDA context, cuDNN kernels và
+    caching allocator được khởi tạo sẵn; request đầu tiên không phải chịu chi phí này.
+    Lỗi warmup chỉ log ra stderr, worker vẫn chạy bình thường.
+    """
+    if not args.warmup_audio:
+        return
+    try:
+        with _inference_context(model, device=args.device, precision=args.precision):
+            model.generate(
+                input=args.warmup_audio,
+                batch_size_s=args.batch_size_s,
+                sentence_timestamp=True,
+                return_raw_text=False,
+                hotword=args.hotword,
+                hotword_weight=args.hotword_weight,
+                disable_punc=args.disable_punc,
+                disable_itn=args.disable_itn,
+            )
+    except Exception:
+        traceback.print_exc(file=sys.stderr)
 
-    model = build_model(
+
+def _run_worker(args, *, model_path: str, vad_model_path: str, punc_model_path: str) -> None:
+    model = get_or_build_model(
         model_path=model_path,
         vad_model_path=vad_model_path,
         punc_model_path=punc_model_path,
@@ -483,7 +893,9 @@ def _run_worker(args, *, model_path: str, vad_model_path: str, punc_model_path:
         ncpu=args.ncpu,
         max_single_segment_time=args.max_single_segment_time,
         max_end_silence_time=args.max_end_silence_time,
+        runtime=args.runtime,
     )
+    _warmup_model(model, args)
 
     _jsonl_write(
         {
@@ -494,8 +906,15 @@ def _run_worker(args, *, model_path: str, vad_model_path: str, punc_model_path:
             "idleSeconds": args.idle_seconds,
         }
     )
+    # Đếm idle từ lúc báo ready: load model + warmup có thể lâu hơn idle_seconds.
+    idle = _IdleExit(args.idle_seconds)
+    idle.start()
 
-    for line in sys.stdin:
+    # Đọc bytes thẳng từ stdin.buffer: orjson.loads (hoặc json.loads) nhận bytes UTF-8,
+    # bỏ bước decode của lớp text.
+    stdin = getattr(sys.stdin, "buffer", sys.stdin)
+    loads = orjson.loads if orjson is not None else json.loads
+    for line in stdin:
         line = line.strip()
         if not line:
             continue
@@ -504,7 +923,7 @@ def _run_worker(args, *, model_path: str, vad_model_path: str, punc_model_path:
             # We are about to do work; do not allow idle shutdown mid-job.
             idle.stop()
 
-            req = json.loads(line)
+            req = loads(line)
             req_id = req.get("id")
             if req.get("type") == "shutdown":
                 _jsonl_write({"type": "shutdown", "id": req_id, "ok": True})
@@ -515,30 +934,34 @@ def _run_worker(args, *, model_path: str, vad_model_path: str, punc_model_path:
             vad_max_single_segment_ms = int(req.get("vadMaxSingleSegmentMs") or args.max_single_segment_time)
             vad_max_end_silence_ms = int(req.get("vadMaxEndSilenceMs") or args.max_end_silence_time)
 
-            Path(out_dir).mkdir(parents=True, exist_ok=True)
-            base = Path(audio_path).stem
-            srt_path = str(Path(out_dir) / f"{base}.funasr.srt")
-
-            res = model.generate(
-                input=audio_path,
-                batch_size_s=args.batch_size_s,
-                sentence_timestamp=True,
-                return_raw_text=False,
-                hotword=args.hotword,
-                hotword_weight=args.hotword_weight,
-                disable_punc=args.disable_punc,
-                disable_itn=args.disable_itn,
-                max_single_segment_time=vad_max_single_segment_ms,
-                max_end_silence_time=vad_max_end_silence_ms,
-            )
+            # Không dùng _ensure_dir (cache): mỗi job 1 thư mục riêng, và thư mục có thể
+            # bị xoá bên ngoài giữa 2 request.
+            os.makedirs(out_dir, exist_ok=True)
+            # os.path thay cho Path trong vòng lặp request (chỉ thao tác chuỗi)
+            base = os.path.splitext(os.path.basename(audio_path))[0]
+            srt_path = os.path.join(out_dir, f"{base}.funasr.srt")
+
+            with _inference_context(model, device=args.device, precision=args.precision):
+                res = model.generate(
+                    input=_preload_input(model, audio_path),
+                    fs=_WAVEFORM_SR,
+                    batch_size_s=args.batch_size_s,
+                    sentence_timestamp=True,
+                    return_raw_text=False,
+                    hotword=args.hotword,
+                    hotword_weight=args.hotword_weight,
+                    disable_punc=args.disable_punc,
+                    disable_itn=args.disable_itn,
+                    max_single_segment_time=vad_max_single_segment_ms,
+                    max_end_silence_time=vad_max_end_silence_ms,
+                )
+            _restore_keys(res, [audio_path])
 
             if req.get("writeJson"):
-                Path(out_dir, f"{base}.funasr.json").write_text(
-                    json.dumps(res, ensure_ascii=False, indent=2), encoding="utf-8"
-                )
+                _write_json(res, os.path.join(out_dir, f"{base}.funasr.json"), pretty=True)
 
-            srt_content = generate_srt_output(res)
-            Path(srt_path).write_text(srt_content, encoding="utf-8")
+            with open(srt_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+                write_srt_output(res, f)
 
             _jsonl_write({"type": "result", "id": req_id, "ok": True, "srtPath": srt_path})
         except Exception as e:
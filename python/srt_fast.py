@@ -0,0 +1,424 @@
+"""
+Tạo SRT từ kết quả FunASR (cắt câu dài, gộp cue, format timestamp).
+
+Module thuần Python, khai báo type đầy đủ để có thể biên dịch AOT bằng mypyc
+(chạy `mypyc srt_fast.py` trong thư mục `python/`): file `.so` sinh ra nằm cạnh
+file này sẽ được import thay cho bản `.py`, không cần đổi gì ở phía gọi.
+Sửa file này thì phải build lại: funasr_runner phát hiện `.so` cũ hơn `.py`,
+cảnh báo và dùng bản `.py`.
+"""
+import functools
+import io
+import os
+import re
+from typing import Any, Dict, FrozenSet, Iterator, List, Set, TextIO, Tuple, TypedDict, Union
+
+
+class SentenceInfo(TypedDict, total=False):
+    text: str
+    start: int
+    end: int
+    timestamp: List[List[int]]  # [[start, end], ...] tương ứng từng chữ
+
+
+class CueDict(TypedDict):
+    start: int
+    end: int
+    text: str
+
+
+class Cue:
+    """
+    1 cue SRT (start/end tính bằng ms) dùng nội bộ khi dựng/gộp/render SRT:
+    __slots__ thay cho dict 3 key (nhỏ hơn, copy chỉ là 1 lần khởi tạo).
+    """
+
+    __slots__ = ("start", "end", "text")
+
+    def __init__(self, start: int, end: int, text: str) -> None:
+        self.start = start
+        self.end = end
+        self.text = text
+
+
+AsrItem = Dict[str, Any]
+AsrResult = Union[List[AsrItem], AsrItem]
+
+
+_TPL = "%02d:%02d:%02d,%03d"
+
+
+@functools.lru_cache(maxsize=4096)
+def _to_srt_time(ms: int) -> str:
+    """Chuyển ms sang định dạng SRT 00:00:00,000"""
+    if ms < 0:
+        ms = 0
+    s, ms = divmod(int(ms), 1000)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return _TPL % (h, m, s, ms)
+
+
+# Dấu câu chốt: được phép ngắt dòng ở đây khi dòng đã đủ dài
+_PUNCT_CUE_BREAK: FrozenSet[str] = frozenset("，。！？；：,.!?;:")
+# Dấu ngắt câu mạnh: luôn ngắt dòng
+_PUNCT_HARD: FrozenSet[str] = frozenset("。！？")
+
+
+def split_long_sentence_by_timestamp(
+    text: str, timestamps: List[Any], max_chars: int = 30
+) -> List[CueDict]:
+    """
+    Hàm quan trọng: Băm nhỏ câu dài dựa trên timestamp từng từ.
+    - text: nội dung câu
+    - timestamps: list [[start, end], [start, end]...] tương ứng từng chữ
+      (giá trị giữ nguyên kiểu, không ép int: có thể là float / numpy int)
+    - max_chars: độ dài tối đa mong muốn của 1 dòng sub
+    """
+    if not timestamps or len(text) != len(timestamps):
+        # Fallback nếu dữ liệu không khớp
+        if not timestamps:
+            return []
+        return [{"text": text, "start": timestamps[0][0], "end": timestamps[-1][1]}]
+
+    sub_segments: List[CueDict] = []
+    append = sub_segments.append
+    # Dòng hiện tại là text[seg_begin:i + 1] (cắt bằng slice, không cộng chuỗi từng chữ)
+    seg_begin = 0
+    current_start = timestamps[0][0]
+
+    # Chỉ duyệt text; timestamp chỉ được đọc tại điểm cắt (end của chữ cuối dòng)
+    for i, char in enumerate(text):
+        # Logic cắt: Nếu dài quá max_chars HOẶC gặp dấu ngắt câu mạnh
+        if i - seg_begin + 1 > max_chars or char in _PUNCT_HARD:
+            last_end = timestamps[i][1]
+            append({"text": text[seg_begin : i + 1], "start": current_start, "end": last_end})
+            # Dòng mới bắt đầu từ end hiện tại (mốc tham chiếu gần đúng)
+            current_start = last_end
+            seg_begin = i + 1
+
+    # Xử lý phần dư (start nối tiếp dòng trước)
+    if seg_begin < len(text):
+        append({"text": text[seg_begin:], "start": current_start, "end": timestamps[-1][1]})
+
+    return sub_segments
+
+
+# Dấu câu chốt hoặc khoảng trắng: các vị trí có thể ngắt dòng khi dòng đã đủ dài
+_CUE_BREAK_RE = re.compile("[" + re.escape("".join(sorted(_PUNCT_CUE_BREAK | {" "}))) + "]")
+
+
+def iter_srt_cues_advanced(result: AsrResult, max_chars_per_line: int = 40) -> Iterator[str]:
+    """
+    Sinh từng cue SRT (cắt câu dài theo timestamp từng chữ) để ghi thẳng ra file.
+    Cue thứ 2 trở đi có dòng trống ở đầu => "".join(...) cho đúng nội dung SRT.
+    """
+    index = 1
+    sep = ""
+    to_srt = _to_srt_time
+
+    items: List[AsrItem] = result if isinstance(result, list) else [result]
+    for item in items:
+        if "sentence_info" not in item:
+            continue
+
+        # Giá trị ms có thể là float / numpy int: đọc dạng Any rồi ép int() khi format,
+        # để bản mypyc (kiểm tra kiểu int) chạy giống hệt bản .py.
+        sentence: Dict[str, Any]
+        for sentence in item["sentence_info"]:
+            text: str = sentence.get("text", "")
+            timestamp_arr: List[Any] = sentence.get("timestamp", [])  # Word-level timestamps
+
+            # Fallback: Nếu không khớp timestamp, dùng sentence gốc
+            if not timestamp_arr or len(timestamp_arr) != len(text):
+                start = int(sentence["start"])
+                end = int(sentence["end"])
+                yield f"{sep}{index}\n{to_srt(start)} --> {to_srt(end)}\n{text}\n"
+                sep = "\n"
+                index += 1
+                continue
+
+            # Câu đủ ngắn: luôn ra đúng 1 cue, bỏ qua bước tìm điểm cắt
+            if len(text) <= max_chars_per_line:
+                start = int(timestamp_arr[0][0])
+                end = int(timestamp_arr[-1][1])
+                yield f"{sep}{index}\n{to_srt(start)} --> {to_srt(end)}\n{text.strip()}\n"
+                sep = "\n"
+                index += 1
+                continue
+
+            # Nhảy thẳng tới điểm cắt kế tiếp thay vì duyệt từng chữ.
+            # Một dòng [start, i] bị cắt tại i khi:
+            # - i là chữ cuối, hoặc
+            # - dòng đã đủ dài (>= max_chars_per_line) VÀ (text[i] là dấu câu chốt
+            #   HOẶC trong dòng đã có khoảng trắng).
+            last = len(text) - 1
+            pos = 0
+            while pos <= last:
+                # Vị trí đầu tiên mà dòng đạt độ dài max_chars_per_line
+                first_long = pos + max(max_chars_per_line - 1, 0)
+                if first_long >= last:
+                    cut = last
+                elif text.find(" ", pos, first_long + 1) != -1:
+                    cut = first_long
+                else:
+                    m = _CUE_BREAK_RE.search(text, first_long, last)
+                    cut = m.start() if m else last
+
+                chunk_start = int(timestamp_arr[pos][0])
+                chunk_end = int(timestamp_arr[cut][1])
+                chunk = text[pos : cut + 1].strip()
+                yield f"{sep}{index}\n{to_srt(chunk_start)} --> {to_srt(chunk_end)}\n{chunk}\n"
+                sep = "\n"
+                index += 1
+                pos = cut + 1
+
+
+def generate_srt_advanced(result: AsrResult, max_chars_per_line: int = 40) -> str:
+    return "".join(iter_srt_cues_advanced(result, max_chars_per_line))
+
+
+def generate_srt_original(result: AsrResult) -> str:
+    return _render_srt(_build_sentence_cues(result))
+
+
+def generate_srt_merged(result: AsrResult) -> str:
+    cues = _build_sentence_cues(result)
+    cues = _merge_cues_for_srt(cues, max_words=_get_merge_max_words())
+    return _render_srt(cues)
+
+
+def _is_merge_enabled() -> bool:
+    raw = os.environ.get("SRT_MERGE_ENABLED", "").strip().lower()
+    if not raw:
+        return False
+    return raw in {"1", "true", "yes", "y", "on"}
+
+
+def _is_strip_middle_punct_enabled() -> bool:
+    raw = os.environ.get("SRT_MERGE_STRIP_MIDDLE_PUNCT", "").strip().lower()
+    if not raw:
+        return True
+    return raw in {"1", "true", "yes", "y", "on"}
+
+
+def generate_srt_output(result: AsrResult) -> str:
+    return generate_srt_merged(result) if _is_merge_enabled() else generate_srt_original(result)
+
+
+def _get_merge_max_words() -> int:
+    raw = os.environ.get("SRT_MERGE_MAX_WORDS", "").strip()
+    try:
+        value = int(raw)
+        if value <= 0:
+            return 15
+        return value
+    except Exception:
+        return 15
+
+
+def _build_sentence_cues(result: AsrResult) -> List[Cue]:
+    cues: List[Cue] = []
+    append = cues.append
+    items: List[AsrItem] = result if isinstance(result, list) else [result]
+    for item in items:
+        if "sentence_info" not in item:
+            continue
+        for sentence in item["sentence_info"]:
+            try:
+                # FunASR luôn có đủ 3 key; int() giữ lại vì start/end có thể là numpy int
+                # (bản mypyc kiểm tra kiểu int khi format timestamp).
+                cue = Cue(int(sentence["start"]), int(sentence["end"]), sentence["text"])
+            except KeyError:
+                cue = Cue(
+                    int(sentence.get("start", 0)),
+                    int(sentence.get("end", 0)),
+                    str(sentence.get("text", "")),
+                )
+            append(cue)
+    return cues
+
+
+def _render_srt(cues: List[Cue]) -> str:
+    buf = io.StringIO()
+    _render_srt_to(cues, buf)
+    return buf.getvalue()
+
+
+def _render_srt_to(cues: List[Cue], fh: TextIO) -> None:
+    """
+    Ghi SRT thẳng ra file handle, mỗi cue 1 lần write (không dựng chuỗi cả file).
+    Cue cuối được rstrip như khi render cả file rồi `.rstrip() + "\n"`.
+    """
+    write = fh.write
+    to_srt = _to_srt_time
+    last = len(cues) - 1
+    for index, cue in enumerate(cues):
+        block = f"{index + 1}\n{to_srt(cue.start)} --> {to_srt(cue.end)}\n{cue.text}"
+        if index < last:
+            write(block + "\n\n")
+        else:
+            write(block.rstrip() + "\n")
+    if last < 0:
+        write("\n")
+
+
+def write_srt_output(result: AsrResult, fh: TextIO) -> None:
+    """Bản ghi-ra-file của generate_srt_output (cùng nội dung)."""
+    cues = _build_sentence_cues(result)
+    if _is_merge_enabled():
+        cues = _merge_cues_for_srt(cues, max_words=_get_merge_max_words())
+    _render_srt_to(cues, fh)
+
+
+_NON_FINAL_JOIN_PUNCT: Set[str] = {",", "，", "、"}
+_FINAL_PUNCT: Set[str] = {".", "!", "?", "。", "！", "？"}
+
+
+# Chữ/số ASCII (isascii() and isalnum()), dựng sẵn để mỗi lần kiểm tra chỉ là 1 phép tra set
+_ASCII_ALNUM: FrozenSet[str] = frozenset(chr(c) for c in range(128) if chr(c).isalnum())
+
+
+def _is_cjk_code(c: int) -> bool:
+    """Han/Hiragana/Katakana/Hangul: mỗi ký tự được đếm là 1 từ."""
+    # 0x3040..0xD7AF bao hết các khoảng CJK: lọc thô 1 phép so sánh trước.
+    # (Bản mypyc chạy nhanh hơn tra bảng phân loại 64K, bitmap 8 KiB hay frozenset ký tự CJK,
+    # và không tốn 10-20 ms dựng bảng lúc import.)
+    return 0x3040 <= c <= 0xD7AF and (
+        0x4E00 <= c <= 0x9FFF  # CJK Unified Ideographs
+        or 0x3400 <= c <= 0x4DBF  # CJK Extension A
+        or c <= 0x30FF  # Hiragana + Katakana
+        or c >= 0xAC00  # Hangul Syllables
+    )
+
+
+def _count_words_mixed(text: str) -> int:
+    """
+    - CJK (Han/Hiragana/Katakana/Hangul): đếm theo ký tự (bỏ whitespace/punct).
+    - Latin: đếm theo token whitespace (bỏ token chỉ có dấu).
+    Một lượt duyệt, không tạo chuỗi/list trung gian (biên dịch mypyc thành vòng lặp C).
+    """
+    if text.isascii():
+        # Không có CJK: token whitespace qua str.split (C); đa số token toàn chữ/số
+        # nên tok.isalnum() (C) quyết định luôn, chỉ token có dấu mới phải duyệt từng ký tự.
+        words = 0
+        for tok in text.split():
+            if tok.isalnum():
+                words += 1
+                continue
+            for ch in tok:
+                if ch.isalnum():
+                    words += 1
+                    break
+        return words
+
+    words = 0
+    in_tok = False  # đang ở trong 1 token (chuỗi không phải whitespace/CJK)
+    counted = False  # token hiện tại đã được đếm (đã gặp chữ/số)
+    for ch in text:
+        c = ord(ch)
+        # Inline _is_cjk_code (vòng lặp nóng; lời gọi hàm chậm ~2x khi chạy không biên dịch)
+        if 0x3040 <= c <= 0xD7AF and (
+            0x4E00 <= c <= 0x9FFF or 0x3400 <= c <= 0x4DBF or c <= 0x30FF or c >= 0xAC00
+        ):
+            words += 1
+            in_tok = False
+        elif ch.isspace():
+            in_tok = False
+        else:
+            if not in_tok:
+                in_tok = True
+                counted = False
+            # Count if token contains at least one letter/digit.
+            if not counted and ch.isalnum():
+                words += 1
+                counted = True
+    return words
+
+
+def _edge_token_has_alnum(text: str, *, tail: bool) -> bool:
+    """
+    Token (chuỗi không phải whitespace/CJK) ở cuối (tail=True) hoặc đầu text
+    có chứa chữ/số hay không.
+    """
+    chars = reversed(text) if tail else iter(text)
+    for ch in chars:
+        if ch.isspace() or _is_cjk_code(ord(ch)):
+            return False
+        if ch.isalnum():
+            return True
+    return False
+
+
+def _try_merge_texts(cur_text: str, right: str, *, strip_join: bool) -> Tuple[str, bool, bool]:
+    """
+    Ghép text cue hiện tại với cue kế tiếp, chỉ xét ký tự biên 1 lần.
+    Trả về (merged_text, ok, fused):
+    - ok=False: cur_text không kết thúc bằng dấu nối (,_，、) => không merge.
+    - fused=True: nối liền không khoảng trắng và token cuối của left + token đầu của right
+      (đều có chữ/số) dính thành 1 token => số từ giảm 1.
+    """
+    if not cur_text or cur_text[-1] not in _NON_FINAL_JOIN_PUNCT:
+        # _FINAL_PUNCT và _NON_FINAL_JOIN_PUNCT rời nhau: 1 phép tra là đủ
+        return "", False, False
+
+    left = cur_text[:-1] if strip_join else cur_text
+    # Only add a space for Latin/digit boundaries (avoid messing with CJK).
+    # (Ký tự chữ/số thì không phải whitespace, nên không cần kiểm tra isspace riêng.)
+    if left and right and left[-1] in _ASCII_ALNUM and right[0] in _ASCII_ALNUM:
+        return f"{left} {right}", True, False
+    fused = _edge_token_has_alnum(left, tail=True) and _edge_token_has_alnum(right, tail=False)
+    return f"{left}{right}", True, fused
+
+
+def _merge_cues_for_srt(cues: List[Cue], *, max_words: int) -> List[Cue]:
+    """
+    Rule:
+    - Merge only when cue[i].text ends with comma-like (,_，、) AND NOT sentence-ending (.?! 。！？)
+    - Only merge when next.start == current.end (gap exactly 0ms).
+    - When merging, remove the join punctuation at the boundary (e.g. "A," + "B," => "AB,").
+    - Do not merge if merged text would exceed max_words (mixed counting).
+    """
+    if not cues:
+        return cues
+
+    out: List[Cue] = []
+    strip_join = _is_strip_middle_punct_enabled()
+    n = len(cues)
+    i = 0
+    while i < n:
+        cue = cues[i]
+        text = cue.text
+        # Không thể merge (cue cuối, hoặc không kết thúc bằng dấu nối): giữ nguyên, không copy
+        if i + 1 >= n or not text or text[-1] not in _NON_FINAL_JOIN_PUNCT:
+            out.append(cue)
+            i += 1
+            continue
+
+        cur = Cue(cue.start, cue.end, text)
+        # Số từ của cur.text, cộng dồn theo từng lần merge thay vì đếm lại cả chuỗi
+        cur_count = _count_words_mixed(text)
+        while i + 1 < n:
+            nxt = cues[i + 1]
+
+            if cur.end != nxt.start:
+                break
+
+            merged_text, ok, fused = _try_merge_texts(cur.text, nxt.text, strip_join=strip_join)
+            if not ok:
+                break
+
+            # Bỏ dấu nối cuối `left` không đổi số từ; 2 token dính nhau thì trừ 1.
+            merged_count = cur_count + _count_words_mixed(nxt.text) - (1 if fused else 0)
+            if merged_count > max_words:
+                break
+
+            cur.text = merged_text
+            cur_count = merged_count
+            cur.end = nxt.end
+            i += 1
+
+        out.append(cur)
+        i += 1
+
+    return out
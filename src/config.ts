@@ -12,6 +12,7 @@ type Config = {
   demucsMp3Bitrate: number;
   demucsJobs: number;
   jobTtlSeconds: number;
+  pythonWorkerIdleSeconds: number;
 };
 
 function readInt(name: string, fallback: number): number {
@@ -39,6 +40,7 @@ export const config: Config = {
   demucsMp3Bitrate: readInt("DEMUCS_MP3_BITRATE", 256),
   demucsJobs: readInt("DEMUCS_JOBS", 2),
   jobTtlSeconds: readInt("JOB_TTL_SECONDS", 6 * 60 * 60),
+  pythonWorkerIdleSeconds: readInt("PYTHON_WORKER_IDLE_SECONDS", 5 * 60),
 };
 
 export function validateConfig(): void {
@@ -54,4 +56,7 @@ export function validateConfig(): void {
   if (!Number.isFinite(config.jobTtlSeconds) || config.jobTtlSeconds <= 0) {
     throw new Error("JOB_TTL_SECONDS must be a positive integer.");
   }
+  if (!Number.isFinite(config.pythonWorkerIdleSeconds) || config.pythonWorkerIdleSeconds <= 0) {
+    throw new Error("PYTHON_WORKER_IDLE_SECONDS must be a positive integer.");
+  }
 }
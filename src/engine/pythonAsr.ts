@@ -18,7 +18,7 @@ export async function runAsrViaPython(args: RunPythonArgs): Promise<{ srtPath: s
 
   await fs.promises.mkdir(args.outDir, { recursive: true });
 
-  const idleSeconds = 5 * 60;
+  const idleSeconds = config.pythonWorkerIdleSeconds;
   const makeWorker = () =>
     new PythonAsrWorker(pythonBin, runner, idleSeconds, (ev) => {
       const ts2 = new Date().toISOString();